@@ -5,15 +5,17 @@
 #It provides a user-friendly interface to clean both the HEAD of important branches and the commit history of a git repository.
 #It uses Docker to run Gitleaks for scanning secrets and BFG Repo-Cleaner for cleaning commit history.
 #It also provides options for dry runs, manual cleanup, and handling of false positives.
-#This script is designed to be run in a terminal or command prompt with Python 3.6+ installed.
+#This script is designed to be run in a terminal or command prompt with Python 3.7+ installed.
 #It requires Git, Docker, and Java (JRE or JDK) to be installed on the system.
 
 # # Usage:
-# pip install argparse colorama
-# python gitclean.py <repo_url> [--bfg <path_to_bfg_jar>] [--dry-run] 
+# pip install argparse colorama ijson
+# pip install orjson (optional, faster parsing of gitleaks reports)
+# python gitclean.py <repo_url> [--bfg <path_to_bfg_jar>] [--dry-run] [--repack]
 # Both <repo_url> and <path_to_bfg_jar> are optional, if not provided it will download the BFG Repo-Cleaner from the internet.
 # --dry-run is an optional flag to skip committing and pushing changes after cleaning. Hence, it will only clean the repository and not push the changes to the remote repository. If not provided the script will commit and push the changes to the remote repository.
 # --bfg is an optional argument to provide the path to the BFG Repo-Cleaner JAR file. If not provided, it will download the BFG Repo-Cleaner from the internet.
+# --repack is an optional flag to run git gc with --aggressive after cleaning the history. It produces smaller packs but can take a long time on large repositories.
     
 # email: shrish108@gmail.com
                
@@ -21,16 +23,45 @@ import os
 import subprocess
 import argparse
 import shutil
-import json
+import sys
+import hashlib
+import mmap
+import urllib.error
+import urllib.request
+import ijson
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    import json
+    json_loads = json.loads
 import logging
+import logging.handlers
 from pathlib import Path
 from colorama import Fore, Style, init
 import signal
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 init(autoreset=True)
 
 BFG_URL = "https://repo1.maven.org/maven2/com/madgag/bfg/1.14.0/bfg-1.14.0.jar"
 BFG_JAR_NAME = "bfg.jar"
+# SHA-256 of the pinned BFG_URL release, checked after every download
+BFG_SHA256 = "1a75e9390541f4b55d9c01256b361b815c1e0a263e2fb3d072b55c2911ead0b7"
+BFG_DOWNLOAD_ATTEMPTS = 2
 MOUNTED=False
+GITLEAKS_IMAGE = "zricethezav/gitleaks:latest"
+# ID of this session's gitleaks container, None when it is not running
+GITLEAKS_CONTAINER = None
+# Host directory mounted at /work in GITLEAKS_CONTAINER
+GITLEAKS_WORK_DIR = None
+# Only these processes are killed when they hold the case-sensitive volume open
+KILLABLE_PROCESS_NAMES = {"git", "java", "bash", "zsh", "sh", "fish"}
+# Reports up to this size are decoded in one go with json_loads, larger ones are streamed with ijson
+IN_MEMORY_REPORT_MAX_SIZE = 100 * 1024 * 1024
+# Serializes input() between branches cleaned in parallel
+PROMPT_LOCK = threading.Lock()
 
 class ColorFormatter(logging.Formatter):
     COLORS = {
@@ -46,32 +77,101 @@ class ColorFormatter(logging.Formatter):
         message = super().format(record)
         return f"{color}{message}{Style.RESET_ALL}"
 
-def docker_gitleaks_dir(path):
-    run_cmd([
-        "docker", "run", "--rm", "-v", f"{path}:/repo",
-        "zricethezav/gitleaks:latest", "dir", "/repo", "--verbose"
-    ], acceptable_codes=[0, 1])
-
-def docker_gitleaks_git(path, report_path=None, verbose=False):
+def start_gitleaks_container(work_dir):
+    """Start one idle gitleaks container with work_dir mounted at /work."""
+    global GITLEAKS_CONTAINER, GITLEAKS_WORK_DIR
+    # Per-session name, so concurrent gitclean runs never touch each other's scanner
     cmd = [
-        "docker", "run", "--rm", "-v", f"{path}:/repo",
-        "zricethezav/gitleaks:latest", "git", "/repo"
+        "docker", "run", "-d", "--name", f"gitclean-gl-{os.getpid()}", "-v", f"{work_dir}:/work",
+        "--entrypoint", "sleep", GITLEAKS_IMAGE, "infinity"
     ]
+    logging.info(f"[CMD] {' '.join(cmd)}")
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        logging.warning(f"Could not start gitleaks container, falling back to docker run per scan: {result.stderr.strip()}")
+        return
+    GITLEAKS_CONTAINER = result.stdout.strip()
+    GITLEAKS_WORK_DIR = work_dir
+
+def stop_gitleaks_container():
+    global GITLEAKS_CONTAINER, GITLEAKS_WORK_DIR
+    if GITLEAKS_CONTAINER is None:
+        return
+    logging.info("Removing gitleaks container...")
+    subprocess.run(["docker", "rm", "-f", GITLEAKS_CONTAINER], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    GITLEAKS_CONTAINER = None
+    GITLEAKS_WORK_DIR = None
+
+def gitleaks_cmd(path):
+    """Return the command prefix running gitleaks and the path it sees for path."""
+    if GITLEAKS_CONTAINER is not None:
+        rel = os.path.relpath(os.path.abspath(path), GITLEAKS_WORK_DIR)
+        if rel != os.pardir and not rel.startswith(os.pardir + os.sep):
+            return ["docker", "exec", GITLEAKS_CONTAINER, "gitleaks"], Path("/work", rel).as_posix()
+
+    # Not under work_dir (e.g. the case-sensitive volume), use a one-off container
+    return ["docker", "run", "--rm", "-v", f"{path}:/repo", GITLEAKS_IMAGE], "/repo"
+
+def docker_gitleaks_dir(path, log_tag=None, cancel=None):
+    prefix, repo = gitleaks_cmd(path)
+    # --verbose prints the secrets themselves, keep them out of cleaner.log
+    run_cmd(prefix + ["dir", repo, "--verbose"], acceptable_codes=frozenset({0, 1}), log_tag=log_tag, cancel=cancel,
+            console_only=True)
+
+def docker_gitleaks_git(path, report_path=None, verbose=False):
+    prefix, repo = gitleaks_cmd(path)
+    cmd = prefix + ["git", repo]
     if report_path:
-        cmd += ["-f=json", f"-r=/repo/{report_path}"]
+        cmd += ["-f=json", f"-r={repo}/{report_path}"]
     if verbose:
         cmd.append("--verbose")
-    run_cmd(cmd, acceptable_codes=[0, 1])
-
-def run_cmd(cmd: list, cwd: str = None, acceptable_codes: list = None):
-    if acceptable_codes is None:
-        acceptable_codes = [0]
+    run_cmd(cmd, acceptable_codes=frozenset({0, 1}), console_only=True)
+
+def stream_cmd(cmd: list, cwd: str = None, log_tag: str = None, console_only: bool = False):
+    """Run cmd, logging its combined stdout/stderr line by line as it arrives.
+
+    With console_only the lines are kept out of the log file.
+    """
+    p = subprocess.Popen(
+        cmd,
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        # Repository content echoed by gitleaks is not necessarily UTF-8, a
+        # decode error would kill the reader and leave the child blocked
+        errors="replace",
+        bufsize=1,
+    )
+
+    # Tag lines when several commands stream at once (branches cleaned in parallel)
+    prefix = f"[{log_tag}] " if log_tag else ""
+
+    def pump():
+        for line in p.stdout:
+            logging.info(f"{prefix}{line.rstrip()}", extra={"console_only": console_only})
+
+    reader = threading.Thread(target=pump, daemon=True)
+    reader.start()
+    returncode = p.wait()
+    reader.join()
+    p.stdout.close()
+    return subprocess.CompletedProcess(cmd, returncode)
+
+def run_cmd(cmd: list, cwd: str = None, acceptable_codes: frozenset = frozenset({0}), log_tag: str = None,
+            cancel: threading.Event = None, console_only: bool = False):
+    """cancel is shared by branches cleaned in parallel: once set, no new command starts."""
+    acc = frozenset(acceptable_codes)
+    cmd_str = ' '.join(cmd)
+    prefix = f"[{log_tag}] " if log_tag else ""
 
     while True:
-        logging.info(f"[CMD] {' '.join(cmd)}")
+        if cancel is not None and cancel.is_set():
+            raise SystemExit(1)
+        logging.info(f"{prefix}[CMD] {cmd_str}")
         try:
-            result = subprocess.run(cmd, cwd=cwd)
-            if result.returncode in acceptable_codes:
+            result = stream_cmd(cmd, cwd=cwd, log_tag=log_tag, console_only=console_only)
+            if result.returncode in acc:
                 return result  # Success, exit the loop
             else:
                 logging.error(f"Command failed with code {result.returncode}")
@@ -79,31 +179,229 @@ def run_cmd(cmd: list, cwd: str = None, acceptable_codes: list = None):
             logging.error(f"Unexpected error: {e}")
 
         # Ask for retry only if command failed
-        retry = input("Do you want to retry the command? [y/N]: ").strip().lower()
+        retry = ask(f"{prefix}Do you want to retry the command? [y/N]: ", cancel=cancel).strip().lower()
         if retry != "y":
+            if cancel is not None:
+                cancel.set()
             exit(1)
 
+def filter_killable_pids(pids):
+    """Keep only the PIDs whose command name is in KILLABLE_PROCESS_NAMES."""
+    if not pids:
+        return set()
+
+    result = subprocess.run(
+        ["ps", "-o", "pid=,comm=", "-p", ",".join(str(pid) for pid in pids)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+    killable = set()
+    for line in result.stdout.splitlines():
+        fields = line.strip().split(None, 1)
+        if len(fields) != 2:
+            continue
+        pid, comm = fields
+        # ps may report a full path, and login shells are prefixed with '-'
+        name = os.path.basename(comm.strip()).lstrip("-")
+        if name in KILLABLE_PROCESS_NAMES:
+            killable.add(int(pid))
+        else:
+            logging.info(f"Skipping process {pid} ({name}) using the volume")
+    return killable
+
+async def run_cmd_async(cmd: list, cwd: str = None, env: dict = None, log_tag: str = None):
+    p = await asyncio.create_subprocess_exec(
+        *cmd, cwd=cwd, env=env,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+    )
+    # Output of concurrent commands interleaves, tag each line with its source
+    prefix = f"[{log_tag or ' '.join(cmd)}] "
+    async for line in p.stdout:
+        logging.info(f"{prefix}{line.decode(errors='replace').rstrip()}")
+    return await p.wait()
+
+def run_cmds_concurrently(cmds: list, cwd: str = None, env: dict = None, log_tag: str = None,
+                          cancel: threading.Event = None):
+    """Run independent commands at the same time, retrying failures through run_cmd."""
+    if cancel is not None and cancel.is_set():
+        raise SystemExit(1)
+    prefix = f"[{log_tag}] " if log_tag else ""
+    for cmd in cmds:
+        logging.info(f"{prefix}[CMD] {' '.join(cmd)}")
+
+    async def run_all():
+        return await asyncio.gather(*(run_cmd_async(cmd, cwd=cwd, env=env, log_tag=log_tag) for cmd in cmds))
+
+    for cmd, returncode in zip(cmds, asyncio.run(run_all())):
+        if returncode != 0:
+            logging.error(f"{prefix}Command failed with code {returncode}: {' '.join(cmd)}")
+            run_cmd(cmd, cwd=cwd, log_tag=log_tag, cancel=cancel)
+
+def push_may_prompt(cwd: str = None, remote: str = "origin"):
+    """Whether pushing to remote could stop to ask for a password or passphrase."""
+    def git_output(*args):
+        return subprocess.run(
+            ["git", *args], cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        ).stdout.strip()
+
+    url = git_output("remote", "get-url", "--push", remote)
+    if url.startswith(("http://", "https://")):
+        # A helper may still come back empty, the push then fails with
+        # prompts disabled and is retried on its own
+        return not git_output("config", "--get-all", "credential.helper")
+    # scp-like user@host:path has a colon before any slash
+    if url.startswith("ssh://") or ":" in url.split("/", 1)[0]:
+        # Without loaded agent keys ssh asks for the key passphrase
+        if not os.environ.get("SSH_AUTH_SOCK"):
+            return True
+        agent = subprocess.run(["ssh-add", "-l"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return agent.returncode != 0
+    # Local paths and file:// never prompt
+    return False
+
+def force_push_all_and_tags():
+    cmds = [
+        ["git", "push", "--force", "--all"],
+        ["git", "push", "--force", "--tags"],
+    ]
+    if push_may_prompt():
+        # Two pushes prompting at once would fight over the terminal
+        for cmd in cmds:
+            run_cmd(cmd)
+        return
+
+    # Branches and tags are independent refs, push them over two connections at
+    # once. Prompts stay disabled as a safety net, a push that still needs
+    # credentials fails and is retried on its own with prompts allowed.
+    env = dict(os.environ, GIT_TERMINAL_PROMPT="0")
+    run_cmds_concurrently(cmds, env=env)
+
+def expire_and_gc(aggressive=False):
+    # One gc process expires the reflog and prunes, instead of a separate
+    # `git reflog expire` that loads the same packs again. Pruning is what
+    # drops the rewritten blobs; --aggressive only re-deltas for smaller packs
+    cmd = [
+        "git",
+        "-c", "gc.reflogExpire=now",
+        "-c", "gc.reflogExpireUnreachable=now",
+        "-c", "gc.pruneExpire=now",
+        "-c", "repack.writeBitmaps=true",
+        "gc",
+    ]
+    if aggressive:
+        cmd.append("--aggressive")
+    run_cmd(cmd)
+
+def fast_rmtree(path):
+    """Remove path with a single rm -rf instead of a per-entry Python walk.
+
+    Raises OSError like shutil.rmtree when path cannot be removed entirely.
+    """
+    if os.name == "posix":
+        try:
+            result = subprocess.run(["rm", "-rf", path], stderr=subprocess.PIPE, text=True, check=False)
+        except OSError as e:
+            logging.warning(f"rm not available ({e}), falling back to shutil.rmtree")
+        else:
+            # rm -rf keeps going past entries it cannot remove, a leftover
+            # directory would make the following cp nest its copy inside
+            if result.returncode != 0 or os.path.lexists(path):
+                raise OSError(f"Failed to remove {path}: {result.stderr.strip()}")
+            return
+
+    shutil.rmtree(path)
+
+def process_groups():
+    """Map each process group id to the set of its member PIDs."""
+    result = subprocess.run(
+        ["ps", "-A", "-o", "pid=,pgid="],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    groups = {}
+    for line in result.stdout.splitlines():
+        fields = line.split()
+        if len(fields) == 2:
+            pid, pgid = map(int, fields)
+            groups.setdefault(pgid, set()).add(pid)
+    return groups
+
+def kill_pids(pids):
+    """SIGKILL pids, one killpg per group made up only of pids, one kill(1) for the rest."""
+    pids = set(pids)
+    if not pids:
+        return 0
+
+    own_pgid = os.getpgid(0)
+    all_groups = process_groups()
+    groups = {}
+    ungrouped = []
+    for pid in pids:
+        try:
+            pgid = os.getpgid(pid)
+        except ProcessLookupError:
+            logging.debug(f"Process {pid} no longer exists")
+            continue
+        except OSError:
+            ungrouped.append(pid)
+            continue
+        # killpg only when every member of the group is ours to kill: a git
+        # spawned by an IDE shares the IDE's group, and our own group holds
+        # the children of run_cmd. A group missing from the ps snapshot may
+        # have gained members since, so it gets the per-PID kill too
+        if pgid != own_pgid and pgid in all_groups and all_groups[pgid] <= pids:
+            groups.setdefault(pgid, []).append(pid)
+        else:
+            ungrouped.append(pid)
+    killed = 0
+    for pgid, members in groups.items():
+        try:
+            os.killpg(pgid, signal.SIGKILL)
+            logging.debug(f"Killed process group {pgid} ({', '.join(map(str, members))})")
+            killed += len(members)
+        except ProcessLookupError:
+            logging.debug(f"Process group {pgid} no longer exists")
+        except PermissionError:
+            logging.warning(f"No permission to kill process group {pgid}")
+            ungrouped.extend(members)
+
+    if ungrouped:
+        result = subprocess.run(
+            ["kill", "-9", *map(str, ungrouped)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        # kill(1) signals every PID it can and prints one line per failure
+        failed = [line for line in result.stderr.splitlines() if line.strip()]
+        if result.returncode != 0:
+            logging.warning(f"kill reported: {result.stderr.strip()}")
+        logging.debug(f"Killed processes {', '.join(map(str, ungrouped))}")
+        killed += max(0, len(ungrouped) - len(failed))
+    return killed
+
 def kill_processes_using_path(path: str):
     current_pid = os.getpid()
 
     try:
+        # Given a mount point, lsof lists every open file on that filesystem
+        # (cwds and mapped packs included) without walking it like +D does
         result = subprocess.run(
-            ["lsof", "-t", "+D", path],
+            ["lsof", "-t", path],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
+            text=True,
         )
 
         if result.stdout:
-            pids = set(int(pid) for pid in result.stdout.strip().split())
-            for pid in pids:
-                if pid != current_pid:
-                    try:
-                        os.kill(pid, signal.SIGKILL)
-                        logging.info(f"Killed process {pid} using {path}")
-                    except ProcessLookupError:
-                        logging.info(f"Process {pid} no longer exists")
-                    except PermissionError:
-                        logging.warning(f"No permission to kill process {pid}")
+            pids = set(int(pid) for pid in result.stdout.split())
+            pids.discard(current_pid)
+            killed = kill_pids(filter_killable_pids(pids))
+            logging.info(f"Killed {killed} processes on {path}")
         else:
             logging.info(f"No processes found using {path}.")
         
@@ -113,9 +411,11 @@ def kill_processes_using_path(path: str):
     except Exception as e:
         logging.error(f"Unexpected error running lsof: {e}")
 
-def gitfilter_repo(repo_url, repo_name, work_dir, dry_run=False):
+def gitfilter_repo(repo_url, repo_name, work_dir, dry_run=False, aggressive=False):
     global MOUNTED
-    dmg_path = os.path.expanduser("~/CaseSensitiveGit.dmg")
+    # Sparse bundles only allocate the bands that are written, so creation is
+    # instant and the 50g cap is only an upper bound
+    dmg_path = os.path.expanduser("~/CaseSensitiveGit.sparsebundle")
     volume_path = "/Volumes/CaseSensitiveGit"
     gitfilter_repo_path = os.path.abspath(os.path.join(volume_path, "gitfilter-repo"))
 
@@ -124,14 +424,19 @@ def gitfilter_repo(repo_url, repo_name, work_dir, dry_run=False):
         logging.warning(f"Disk image {dmg_path} already exists. Skipping creation.")
     else:
         run_cmd([
-            "hdiutil", "create", "-size", "1g", "-fs", "Case-sensitive HFS+",
-            "-volname", "CaseSensitiveGit", dmg_path
+            "hdiutil", "create", "-size", "50g", "-type", "SPARSEBUNDLE",
+            "-fs", "Case-sensitive HFS+", "-volname", "CaseSensitiveGit", dmg_path
         ])
 
     logging.info("Mounting the case-sensitive disk image...")
-    run_cmd(["hdiutil", "attach", dmg_path])
+    # -nobrowse keeps Finder off the volume and -owners off skips permission
+    # bookkeeping, so fewer handles are left open when it is detached
+    run_cmd(["hdiutil", "attach", "-nobrowse", "-owners", "off", dmg_path])
     MOUNTED = True  # Only mark as mounted after successful attach
 
+    # Keep Spotlight from indexing (and holding open) the cloned mirror
+    Path(volume_path, ".metadata_never_index").touch()
+
     os.chdir(volume_path)
     os.makedirs(gitfilter_repo_path, exist_ok=True)
     os.chdir(gitfilter_repo_path)
@@ -168,8 +473,7 @@ def gitfilter_repo(repo_url, repo_name, work_dir, dry_run=False):
         "--replace-text", secrets_txt_path
     ])
 
-    run_cmd(["git", "reflog", "expire", "--expire=now", "--all"])
-    run_cmd(["git", "gc", "--prune=now", "--aggressive"])
+    expire_and_gc(aggressive=aggressive)
 
     docker_gitleaks_git(os.getcwd(), verbose=True)
 
@@ -177,15 +481,14 @@ def gitfilter_repo(repo_url, repo_name, work_dir, dry_run=False):
         logging.info("[DRY RUN] Skipping force-push.")
     else:
         if prompt_confirm("Force-push cleaned commit history and tags? "):
-            run_cmd(["git", "push", "--force", "--all"])
-            run_cmd(["git", "push", "--force", "--tags"])
+            force_push_all_and_tags()
         else:
             logging.warning("Force push skipped.")
 
     #remove gitfilter-repo directory
     os.chdir("..")
     logging.info("Removing gitfilter-repo directory...")
-    shutil.rmtree(gitfilter_repo_path)  
+    fast_rmtree(gitfilter_repo_path)
 
     os.chdir(volume_path)
     os.chdir(work_dir)
@@ -198,53 +501,193 @@ def gitfilter_repo(repo_url, repo_name, work_dir, dry_run=False):
 
 
 def get_secrets_from_report(report_file):
-    with open(report_file, "r") as f:
-        try:
-            report = json.load(f)
-        except json.JSONDecodeError:
-            logging.warning("Invalid JSON in gitleaks report")
-            return []
-    return list({entry["Secret"] for entry in report if "Secret" in entry})
+    st = os.stat(report_file)
+    if st.st_size == 0:
+        logging.warning("Empty gitleaks report")
+        return []
 
-def write_secrets_txt(secrets, output_path):
-    with open(output_path, "w") as f:
-        for secret in secrets:
-            f.write(f"{secret}\n")
+    try:
+        if st.st_size <= IN_MEMORY_REPORT_MAX_SIZE:
+            with open(report_file, "rb") as f:
+                report = json_loads(f.read())
+            secrets = unique_secrets(entry["Secret"] for entry in report if "Secret" in entry)
+        else:
+            # Too big to hold in memory, stream just the Secret fields
+            with open(report_file, "rb") as f:
+                secrets = unique_secrets(ijson.items(f, "item.Secret"))
+    except (ValueError, ijson.JSONError):
+        logging.warning("Invalid JSON in gitleaks report")
+        return []
+    return secrets
+
+def unique_secrets(secrets):
+    """Deduplicate secrets as they stream in, keeping first-seen order."""
+    # Exact membership on purpose: a probabilistic filter (e.g. Bloom) would
+    # occasionally treat a new secret as seen and leave it out of secrets.txt
+    return list(dict.fromkeys(secrets))
 
-def prompt_confirm(message):
-    answer = input(f"{message} [y/N]: ").strip().lower()
+def write_secrets_txt(secrets, output_path):
+    # secrets come from get_secrets_from_report and are already unique
+    with open(output_path, "w", buffering=1 << 20) as f:
+        f.writelines(secret + "\n" for secret in secrets)
+
+def ask(message, cancel=None):
+    """input() serialized between threads, refusing once cancel is set."""
+    with PROMPT_LOCK:
+        if cancel is not None and cancel.is_set():
+            raise SystemExit(1)
+        answer = input(message)
+        # An abort may have come in while this thread sat in input()
+        if cancel is not None and cancel.is_set():
+            raise SystemExit(1)
+        return answer
+
+def prompt_confirm(message, cancel=None):
+    answer = ask(f"{message} [y/N]: ", cancel=cancel).strip().lower()
     return answer == "y"
 
-def clean_working_directory(repo_path, branch, dry_run=False):
-    os.chdir(repo_path)
+def clean_working_directory(repo_path, branch, dry_run=False, cancel=None):
+    # Runs from worker threads for multiple branches, so stay off os.chdir
+    repo_path = os.path.abspath(repo_path)
     logging.info(f"Checking out branch: {branch}")
-    run_cmd(["git", "checkout", branch])
+    run_cmd(["git", "checkout", branch], cwd=repo_path, log_tag=branch, cancel=cancel)
 
-    docker_gitleaks_dir(os.getcwd())
+    docker_gitleaks_dir(repo_path, log_tag=branch, cancel=cancel)
 
-    response = input("[ACTION REQUIRED] Cleanup the files manually if secrets are found.\n"
-                        "Ignore false positives, note them separately.\n"
-                        "Type 'exit' to abort or press Enter to continue... ").strip().lower()
+    response = ask(f"[ACTION REQUIRED] [{branch}] Cleanup the files manually in {repo_path} if secrets are found.\n"
+                      "Ignore false positives, note them separately.\n"
+                      "Type 'exit' to abort or press Enter to continue... ", cancel=cancel).strip().lower()
     if response == "exit":
         logging.warning("Exiting as requested by user.")
+        if cancel is not None:
+            cancel.set()
         exit(0)
 
     logging.info(f"Scanning after manual cleanup: {branch}")
-    docker_gitleaks_dir(os.getcwd())
+    docker_gitleaks_dir(repo_path, log_tag=branch, cancel=cancel)
 
     if dry_run:
             logging.info(f"[DRY RUN] Skipping commit & push for branch: {branch}")
     else:
-        if prompt_confirm("Do you want to commit and push changes? "):
+        if prompt_confirm(f"[{branch}] Do you want to commit and push changes? ", cancel=cancel):
             logging.info(f"Committing and pushing changes for branch: {branch}")
-            run_cmd(["git", "add", "."])
-            run_cmd(["git", "commit", "-m", f"Removed secrets from {branch}"])
-            run_cmd(["git", "push", "origin", branch])
+            run_cmd(["git", "add", "."], cwd=repo_path, log_tag=branch, cancel=cancel)
+            run_cmd(["git", "commit", "-m", f"Removed secrets from {branch}"], cwd=repo_path, log_tag=branch, cancel=cancel)
+            run_cmd(["git", "push", "origin", branch], cwd=repo_path, log_tag=branch, cancel=cancel)
         else:
             logging.warning(f"[SKIPPED] Commit & push skipped for branch: {branch}")
-    os.chdir("..")
 
-def clean_commit_history(mirror_path, bfg_jar_path, secrets_txt_path, dry_run=False):
+def list_worktrees(repo_path):
+    """Map each registered worktree path of repo_path to its checked-out branch."""
+    result = subprocess.run(
+        ["git", "worktree", "list", "--porcelain"],
+        cwd=repo_path,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    worktrees = {}
+    path = None
+    for line in result.stdout.splitlines():
+        if line.startswith("worktree "):
+            path = os.path.realpath(line[len("worktree "):])
+            worktrees[path] = None
+        elif line.startswith("branch refs/heads/") and path:
+            worktrees[path] = line[len("branch refs/heads/"):]
+    return worktrees
+
+def remove_worktree(repo_path, wt_path):
+    # Not run_cmd: this runs during cleanup, possibly after an abort
+    status = subprocess.run(
+        ["git", "status", "--porcelain"],
+        cwd=wt_path,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    if status.returncode != 0 or status.stdout.strip():
+        logging.warning(f"Keeping worktree {wt_path}, it has uncommitted changes. "
+                        f"Remove it with 'git worktree remove {wt_path}' when done.")
+        return
+
+    result = subprocess.run(
+        ["git", "worktree", "remove", wt_path],
+        cwd=repo_path,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    if result.returncode != 0:
+        logging.warning(f"Failed to remove worktree {wt_path}: {result.stdout.strip()}")
+
+def clean_branches_in_parallel(repo_path, branches, dry_run=False):
+    """Give each branch its own git worktree and clean them concurrently.
+
+    input() cannot be interrupted from another thread, so on Ctrl-C a branch
+    waiting at a prompt keeps the run alive until Enter is pressed.
+    """
+    repo_path = os.path.abspath(repo_path)
+    current = subprocess.run(
+        ["git", "rev-parse", "--abbrev-ref", "HEAD"],
+        cwd=repo_path,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    ).stdout.strip()
+
+    # Forget worktrees whose directories are gone (e.g. left by a killed run)
+    subprocess.run(["git", "worktree", "prune"], cwd=repo_path)
+    registered = list_worktrees(repo_path)
+
+    # Scoped to this run: set when any branch exits, stops the others
+    cancel = threading.Event()
+    worktrees = {}
+    added = []
+    try:
+        for branch in branches:
+            # A branch can only be checked out once, reuse the clone for its own
+            if branch == current:
+                worktrees[branch] = repo_path
+                continue
+            # The digest keeps e.g. feature/a and feature-a apart
+            digest = hashlib.sha1(branch.encode()).hexdigest()[:8]
+            wt_path = os.path.join(os.path.dirname(repo_path), f"wt-{branch.replace('/', '-')}-{digest}")
+            if registered.get(os.path.realpath(wt_path), "") == branch:
+                # Kept by a previous run because it had uncommitted changes
+                logging.warning(f"Reusing worktree {wt_path} for branch '{branch}'")
+            else:
+                # Never delete what is there: it may hold edits, or belong to
+                # a clone that has been discarded since
+                base, n = wt_path, 1
+                while os.path.exists(wt_path):
+                    n += 1
+                    wt_path = f"{base}-{n}"
+                logging.info(f"Adding worktree for branch '{branch}' at {wt_path}")
+                run_cmd(["git", "worktree", "add", wt_path, branch], cwd=repo_path, log_tag=branch)
+            added.append(wt_path)
+            worktrees[branch] = wt_path
+
+        with ThreadPoolExecutor(max_workers=min(8, len(branches))) as ex:
+            futures = [ex.submit(clean_working_directory, worktrees[b], b, dry_run=dry_run, cancel=cancel) for b in branches]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except BaseException as e:
+                # Branches not started yet are dropped, running ones stop at
+                # their next command or prompt
+                cancel.set()
+                if isinstance(e, KeyboardInterrupt):
+                    logging.warning("Aborting, press Enter to answer any pending prompt and finish.")
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        # Worktrees with uncommitted edits (declined commit, dry run) are kept
+        for wt_path in added:
+            logging.info(f"Removing worktree {wt_path}")
+            remove_worktree(repo_path, wt_path)
+
+def clean_commit_history(mirror_path, bfg_jar_path, secrets_txt_path, dry_run=False, aggressive=False):
     os.chdir(mirror_path)
     report_file = os.path.join(mirror_path, "gitleaks-report.json")
 
@@ -265,8 +708,7 @@ def clean_commit_history(mirror_path, bfg_jar_path, secrets_txt_path, dry_run=Fa
 
     run_cmd(["java", "-jar", bfg_jar_path, "--replace-text", secrets_txt_path, mirror_path])
 
-    run_cmd(["git", "reflog", "expire", "--expire=now", "--all"])
-    run_cmd(["git", "gc", "--prune=now", "--aggressive"])
+    expire_and_gc(aggressive=aggressive)
 
     docker_gitleaks_git(os.getcwd(), verbose=True)
     
@@ -275,8 +717,7 @@ def clean_commit_history(mirror_path, bfg_jar_path, secrets_txt_path, dry_run=Fa
     if prompt_confirm("Still you can try that as the final push will ask your confirmation. Do you want to proceed with hard cleaning? "):
         run_cmd(["java", "-jar", bfg_jar_path, "--replace-text", secrets_txt_path, "--no-blob-protection", mirror_path])
 
-        run_cmd(["git", "reflog", "expire", "--expire=now", "--all"])
-        run_cmd(["git", "gc", "--prune=now", "--aggressive"])
+        expire_and_gc(aggressive=aggressive)
         docker_gitleaks_git(os.getcwd())
     else:
         logging.warning("[SKIPPED] Skipping hard cleaning with --no-blob-protection flag.")
@@ -286,16 +727,47 @@ def clean_commit_history(mirror_path, bfg_jar_path, secrets_txt_path, dry_run=Fa
     else:
         if prompt_confirm("Do you want to force-push cleaned commit history and tags? "):
             logging.info("Force pushing cleaned commit history and tags.")
-            run_cmd(["git", "push", "--force", "--all"])
-            run_cmd(["git", "push", "--force", "--tags"])
+            force_push_all_and_tags()
         else:
             logging.warning("[SKIPPED] Force push skipped.")
     os.chdir("..")
 
+def file_checksum(path, algorithm):
+    with open(path, "rb") as f:
+        if hasattr(hashlib, "file_digest"):  # Python 3.11+
+            return hashlib.file_digest(f, algorithm).hexdigest()
+
+        h = hashlib.new(algorithm)
+        # mmap cannot map an empty file
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                h.update(memoryview(mm))
+        return h.hexdigest()
+
+def fetch_bfg(part_path):
+    """Download BFG_URL into part_path, resuming a previous partial download."""
+    existing = part_path.stat().st_size if part_path.exists() else 0
+    headers = {"Range": f"bytes={existing}-"} if existing else {}
+    if existing:
+        logging.info(f"Resuming BFG download at byte {existing}")
+
+    request = urllib.request.Request(BFG_URL, headers=headers)
+    try:
+        with urllib.request.urlopen(request) as r:
+            # 206 means the server honoured the Range header, otherwise start over
+            mode = "ab" if existing and r.status == 206 else "wb"
+            with open(part_path, mode) as f:
+                shutil.copyfileobj(r, f, length=1 << 20)
+    except urllib.error.HTTPError as e:
+        # 416: nothing left past `existing`, the partial file is already complete
+        if not (existing and e.code == 416):
+            raise
+
 def download_bfg():
     bfg_dir = Path.home() / ".bfg"
     bfg_dir.mkdir(parents=True, exist_ok=True)
     local_path = bfg_dir / BFG_JAR_NAME
+    part_path = bfg_dir / f"{BFG_JAR_NAME}.part"
 
     if local_path.exists():
         logging.info(f"BFG already downloaded at {local_path}")
@@ -303,14 +775,54 @@ def download_bfg():
 
     logging.info(f"Downloading BFG Repo-Cleaner from {BFG_URL}")
     try:
-        import urllib.request
-        urllib.request.urlretrieve(BFG_URL, local_path)
-        logging.info(f"[SUCCESS] Downloaded BFG to {local_path}")
-        return str(local_path)
+        for attempt in range(1, BFG_DOWNLOAD_ATTEMPTS + 1):
+            fetch_bfg(part_path)
+            actual = file_checksum(part_path, "sha256")
+            if actual == BFG_SHA256:
+                os.replace(part_path, local_path)
+                logging.info(f"[SUCCESS] Downloaded BFG to {local_path}")
+                return str(local_path)
+            logging.warning(f"Checksum mismatch for BFG download (attempt {attempt}/{BFG_DOWNLOAD_ATTEMPTS}): expected {BFG_SHA256}, got {actual}")
+            part_path.unlink()
     except Exception as e:
         logging.error(f"Failed to download BFG: {e}")
         raise SystemExit(1)
 
+    logging.error("Failed to download BFG: checksum verification failed")
+    raise SystemExit(1)
+
+def link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def clone_tree(src, dst):
+    """Copy src to dst as a copy-on-write clone where the filesystem allows it."""
+    # cp -R into an existing directory copies src inside it instead
+    if os.path.lexists(dst):
+        raise FileExistsError(f"Refusing to copy {src}, {dst} already exists")
+
+    if sys.platform == "darwin":
+        # -c makes cp use clonefile(2) on APFS
+        cmd = ["cp", "-Rc", src, dst]
+    elif sys.platform.startswith("linux"):
+        cmd = ["cp", "-R", "--reflink=auto", src, dst]
+    else:
+        cmd = None
+
+    if cmd:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if result.returncode == 0:
+            return
+        logging.warning(f"{' '.join(cmd)} failed, falling back to hardlinks: {result.stderr.strip()}")
+        if os.path.exists(dst):
+            fast_rmtree(dst)
+
+    # Git replaces objects and refs instead of writing them in place, so
+    # hardlinks keep the backup intact while the mirror is rewritten
+    shutil.copytree(src, dst, copy_function=link_or_copy)
+
 def check_dependencies():
     logging.info("Checking required dependencies...")
     tools = {
@@ -319,29 +831,47 @@ def check_dependencies():
         "java": "Java (JRE or JDK) is required to run BFG Repo-Cleaner.",
     }
 
+    # Start `docker info` first, a cold daemon can take a while to answer
+    try:
+        docker_info = subprocess.Popen(["docker", "info"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError as e:
+        docker_info = None
+        docker_error = e
+
+    env_path = os.environ.get("PATH", "").split(os.pathsep)
+
+    def on_path(tool):
+        # shutil.which knows about PATHEXT (git.exe etc.) on Windows
+        if os.name != "posix":
+            return shutil.which(tool) is not None
+        candidates = (os.path.join(d, tool) for d in env_path if d)
+        return any(os.access(c, os.X_OK) and os.path.isfile(c) for c in candidates)
+
     missing = []
     for tool, message in tools.items():
-        if shutil.which(tool) is None:
+        if not on_path(tool):
             logging.error(f"[MISSING] '{tool}' not found: {message}")
             missing.append(tool)
 
     if missing:
+        if docker_info:
+            docker_info.kill()
+            docker_info.wait()
         logging.critical(f"\nMissing required tools: {', '.join(missing)}")
         logging.critical("Please install the missing dependencies and try again.")
         exit(1)
 
     logging.info("[OK] All required dependencies are available.")
 
-    try:
-        subprocess.run(["docker", "info"], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        logging.info("[OK] Docker is running and accessible.")
-    except subprocess.CalledProcessError:
+    if docker_info is None:
+        logging.critical(f"Docker check failed: {docker_error}")
+        exit(1)
+
+    if docker_info.wait() != 0:
         logging.critical("Docker is installed but not running or not accessible to this user.")
         logging.critical("→ Make sure the Docker daemon is running and your user is added to the 'docker' group.")
         exit(1)
-    except Exception as e:
-        logging.critical(f"Docker check failed: {e}")
-        exit(1)
+    logging.info("[OK] Docker is running and accessible.")
 
 
 def main():
@@ -364,6 +894,7 @@ def main():
         parser.add_argument("repo_url", help="URL of the git repository")
         parser.add_argument("--bfg", required=False, help="Path to BFG JAR (optional)")
         parser.add_argument("--dry-run", action="store_true", help="Skip committing and pushing changes")
+        parser.add_argument("--repack", action="store_true", help="Run git gc --aggressive after cleaning history (slow, smaller packs)")
         args = parser.parse_args()
 
         repo_name = Path(args.repo_url).stem
@@ -389,15 +920,29 @@ def main():
         console_handler = logging.StreamHandler()
         console_handler.setFormatter(formatter)
 
+        # Buffer file writes so streamed command output is not written line by line.
+        # basicConfig only formats the MemoryHandler, so give its target the
+        # same default format the bare FileHandler used to get
+        log_file_handler = logging.FileHandler(log_path, mode='a')
+        log_file_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        file_handler = logging.handlers.MemoryHandler(
+            capacity=1024,
+            flushLevel=logging.ERROR,
+            target=log_file_handler
+        )
+        # Scanner output carries the secrets in plain text, console only
+        file_handler.addFilter(lambda record: not getattr(record, "console_only", False))
+
         logging.basicConfig(
             level=logging.INFO,
             handlers=[
-                logging.FileHandler(log_path, mode='a'),
+                file_handler,
                 console_handler
             ]
         )
         logging.info(f"Starting Git Secret Cleaner CLI for repository: {args.repo_url}, working in {os.getcwd()}")
         check_dependencies()
+        start_gitleaks_container(work_dir)
 
         if not os.path.exists(repo_name):
             logging.info(f"Cloning repository {args.repo_url}")
@@ -418,7 +963,7 @@ def main():
                 run_cmd(["git", "pull"], cwd=repo_name)
             elif response == "discard":
                 logging.info("Deleting local copy and re-cloning repository...")
-                shutil.rmtree(os.path.abspath(repo_name))
+                fast_rmtree(os.path.abspath(repo_name))
                 logging.info(f"Recloning repository {args.repo_url}")
                 run_cmd(["git", "clone", args.repo_url])
             elif response == "exit":
@@ -441,7 +986,7 @@ def main():
 
             if response == "discard":
                 logging.info("Deleting local copy and re-cloning mirror of repository...")
-                shutil.rmtree(os.path.abspath(mirror_dir))
+                fast_rmtree(os.path.abspath(mirror_dir))
                 logging.info(f"Recloning repository {args.repo_url}")
                 run_cmd(["git", "clone", "--mirror", args.repo_url])
             elif response == "exit":
@@ -459,15 +1004,15 @@ def main():
 
             if response == "discard":
                 logging.info(f"Removing existing backup at {backup_dir}")
-                shutil.rmtree(backup_dir)
+                fast_rmtree(backup_dir)
                 logging.info(f"Creating new backup from mirror at {backup_dir}")
-                shutil.copytree(mirror_dir, backup_dir)
+                clone_tree(mirror_dir, backup_dir)
             elif response == "exit":
                 logging.info("Exiting as requested by user.")
                 exit(0)
         else:
             logging.info(f"Creating backup from mirror at {backup_dir}")
-            shutil.copytree(mirror_dir, backup_dir)
+            clone_tree(mirror_dir, backup_dir)
 
         bfg_path = args.bfg or download_bfg()
         mirror_path = os.path.abspath(mirror_dir)
@@ -485,18 +1030,21 @@ def main():
                 if branches_input == "":
                     logging.warning("Branch name cannot be empty.")
                     continue
-                branches = [b.strip() for b in branches_input.split(",") if b.strip()]
-                for branch in branches:
-                    logging.info(f"Cleaning branch '{branch}'")
-                    clean_working_directory(repo_name, branch, dry_run=args.dry_run)
+                branches = list(dict.fromkeys(b.strip() for b in branches_input.split(",") if b.strip()))
+                if len(branches) == 1:
+                    logging.info(f"Cleaning branch '{branches[0]}'")
+                    clean_working_directory(repo_name, branches[0], dry_run=args.dry_run)
+                else:
+                    logging.info(f"Cleaning branches {', '.join(branches)} in parallel")
+                    clean_branches_in_parallel(repo_name, branches, dry_run=args.dry_run)
 
             elif choice == "2":
                 logging.info("Starting commit history cleaning")
-                clean_commit_history(mirror_path, bfg_path, secrets_path, dry_run=args.dry_run)
+                clean_commit_history(mirror_path, bfg_path, secrets_path, dry_run=args.dry_run, aggressive=args.repack)
 
             elif choice == "3":
                 logging.info("Starting commit history cleaning")
-                gitfilter_repo(args.repo_url, repo_name, work_dir, dry_run=args.dry_run)
+                gitfilter_repo(args.repo_url, repo_name, work_dir, dry_run=args.dry_run, aggressive=args.repack)
 
             elif choice == "4":
                 logging.info("Exiting program.")
@@ -519,6 +1067,8 @@ def main():
         except:
             pass  # work_dir might not exist if script fails early
 
+        stop_gitleaks_container()
+
         # Hardcoded paths
         gitfilter_repo_path = "/Volumes/CaseSensitiveGit/gitfilter-repo"
         volume_path = "/Volumes/CaseSensitiveGit"
@@ -526,7 +1076,7 @@ def main():
         try:
             if os.path.exists(gitfilter_repo_path):
                 logging.info("Removing gitfilter-repo directory...")
-                shutil.rmtree(gitfilter_repo_path)
+                fast_rmtree(gitfilter_repo_path)
         except Exception as cleanup_err:
             logging.warning(f"Failed to remove gitfilter-repo directory: {cleanup_err}")
 
@@ -538,6 +1088,9 @@ def main():
             except Exception as umount_err:
                 logging.error(f"Failed to unmount volume: {umount_err}")
 
+        for handler in logging.root.handlers:
+            handler.flush()
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file